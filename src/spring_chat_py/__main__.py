@@ -13,11 +13,18 @@ from spring_chat_py.embeddings.upsert_emebd_to_qdrant import upload
 from spring_chat_py.embeddings.search import search
 from spring_chat_py.designing_ai.extract_designing_ai3 import create_extracts
 
+try:
+    from yaml import CSafeLoader as YamlLoader  # libyaml binding
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
 log = logging.getLogger(__name__)
 
-with open("logging.yaml") as f:
-    config = yaml.safe_load(f)
-logging.config.dictConfig(config)
+# configure logging only once, re-imports must not reset handlers
+if not logging.getLogger().handlers:
+    with open("logging.yaml") as f:
+        config = yaml.load(f, Loader=YamlLoader)
+    logging.config.dictConfig(config)
 
 
 def main(argv: list[str] | None = None) -> int:
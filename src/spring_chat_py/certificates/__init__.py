@@ -1,8 +1,12 @@
-import json, logging, requests, uuid
+import json, logging, os, requests, uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client.models import Distance, VectorParams, Datatype
+from qdrant_client.models import ScalarQuantization, ScalarQuantizationConfig, ScalarType
 from qdrant_client.models import PointStruct
 
 log = logging.getLogger(__name__)
@@ -11,6 +15,14 @@ BASE_DIR   = Path(__file__).resolve().parent
 JSON_PATH  = BASE_DIR / "certificates.json"
 OLLAMA_URL = "http://localhost:11434/api/embed"
 
+# concurrent embedding batches in flight against Ollama
+OLLAMA_MAX_WORKERS = int(os.environ.get("OLLAMA_MAX_WORKERS", "2"))
+
+# one pooled keep-alive session for all Ollama calls; Ollama serves plain
+# HTTP/1.1 (no h2c), so concurrency comes from one pooled connection per worker
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=max(32, OLLAMA_MAX_WORKERS), max_retries=0))
+
 client = QdrantClient(url="http://localhost:6333")
 
 
@@ -25,6 +37,7 @@ def load_certificates() -> List[Dict[str, Any]]:
         log.debug("%s %s", e["id"], e["Short-Name"])
         content = e["Short-Name"] + " "+ e["Name"] + " " + e["Department"] + " " + e["University"] + " " + e["Issued"]
         chunk={
+            "id":       e["id"],
             "content":  content,
             "metadata": {
                 "Short-Name": e["Short-Name"],
@@ -38,6 +51,24 @@ def load_certificates() -> List[Dict[str, Any]]:
         
     return chunks
 
+def _post_embed(inputs: List[str], model: str) -> List[List[float]]:
+    payload = {"model": model, "input": inputs}
+    resp = _SESSION.post(OLLAMA_URL, json=payload, timeout=60)
+    resp.raise_for_status()
+    return resp.json()["embeddings"]
+
+
+def _post_batch(b: int, inputs: List[str], model: str) -> Tuple[int, List[List[float]]]:
+    embs = _post_embed(inputs, model)
+
+    if len(embs) != len(inputs):
+        # safety net: fall back to one request per text
+        log.warning("Embedding count mismatch: got %d embeddings for %d inputs, retrying per text", len(embs), len(inputs))
+        embs = [_post_embed([text], model)[0] for text in inputs]
+
+    return b, embs
+
+
 def embed_chunks(
     chunks: List[Dict[str, Any]],
     model: str      = "bge-m3",
@@ -49,24 +80,20 @@ def embed_chunks(
     """
     log.debug("embed_chunks: %d chunks, model=%s, batch_size=%d", len(chunks), model, batch_size)
 
-    vectors: List[List[float]] = []
-
-    for b in range(0, len(chunks), batch_size):
-        batch = chunks[b : b + batch_size]
-        inputs = [c["content"] for c in batch]
+    batches = [(b, chunks[b : b + batch_size]) for b in range(0, len(chunks), batch_size)]
+    results: Dict[int, List[List[float]]] = {}
 
-        payload = {"model": model, "input": inputs}
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=60)
-        resp.raise_for_status()
+    with ThreadPoolExecutor(max_workers=OLLAMA_MAX_WORKERS) as executor:
+        futures = [executor.submit(_post_batch, b, [c["content"] for c in batch], model) for b, batch in batches]
+        for future in as_completed(futures):
+            b, embs = future.result()
+            results[b] = embs
 
-        data = resp.json()
-        embs = data["embeddings"]
-
-        if len(embs) != len(batch):
-            raise ValueError(f"Embedding count mismatch: got {len(embs)} embeddings for {len(batch)} inputs")
+    vectors: List[List[float]] = []
 
+    for b, batch in batches:
         # preserve order: zip(batch, embs) matches inputs order
-        for item, emb in zip(batch, embs):
+        for item, emb in zip(batch, results[b]):
             item["embedding_model"] = model
             item["embeddings"] = emb
             vectors.append(emb)
@@ -90,7 +117,11 @@ def recreate_collection(collection_name: str, vector_size: int = 1024):
     if not exists:
         client.create_collection(
             collection_name=collection_name,
-            vectors_config=VectorParams(size=vector_size, distance=distance),
+            # float16 storage halves vector memory; int8 copies stay in RAM for search
+            vectors_config=VectorParams(size=vector_size, distance=distance, datatype=Datatype.FLOAT16),
+            quantization_config=ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True)
+            ),
         )
     
     payloads:   List[Dict[str, Any]]  = load_certificates()
@@ -99,13 +130,20 @@ def recreate_collection(collection_name: str, vector_size: int = 1024):
     embeddings: List[List[float]]     = embed_chunks(payloads)
     if len(payloads) != len(embeddings):
         raise ValueError("Payload / embedding count mismatch")
+
+    # L2-normalize all vectors in one op and send them as float16 values
+    arr = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    arr /= norms
+    vectors: List[List[float]] = arr.astype(np.float16).tolist()
     
     points: List[PointStruct] = []
 
-    for payload, vector in zip(payloads, embeddings):
+    for payload, vector in zip(payloads, vectors):
         #log.debug("metadata: %s", payload["metadata"])
         point = PointStruct(
-            id=str(uuid.uuid4()),
+            id=str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{JSON_PATH.name}#{payload['id']}")),
             vector=vector,
             payload={
                 "doc_content": payload["content"],
@@ -114,6 +152,6 @@ def recreate_collection(collection_name: str, vector_size: int = 1024):
         )
         points.append(point)
     
-    client.upsert(collection_name=collection_name, points=points)
+    client.upload_points(collection_name=collection_name, points=points, batch_size=256, parallel=4, wait=True)
     log.info("certificates uploaded to Qdrant Vector Store %s", collection_name)
 
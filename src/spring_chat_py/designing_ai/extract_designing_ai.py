@@ -7,9 +7,12 @@ Created on 5 Feb 2026
 import logging
 import fitz  # PyMuPDF
 import re, os, sys
-import json
+from bisect import bisect_right
+import orjson
 import uuid
-from statistics import median
+import numpy as np
+from array import array
+from functools import lru_cache
 from pathlib import Path
 
 
@@ -28,7 +31,15 @@ HEADER_SCALE_H2 = 1.20
 TITLE_SCALE     = 1.75
 TOP_BOTTOM_MARGIN_PX = 45
 
+# --- Text normalization ---
+_HYPHEN_RE      = re.compile(r"(\w)-\n(\w)")
+_SINGLE_NL_RE   = re.compile(r"(?<!\n)\n(?!\n)")
+_WS_RE          = re.compile(r"[ \t]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_PARA_BREAK_RE  = re.compile(r"\n\s*\n")
 
+
+@lru_cache(maxsize=256)
 def is_bold_font(font_name: str) -> bool:
     f = (font_name or "").lower()
     return "bold" in f or "black" in f or "demi" in f
@@ -38,8 +49,7 @@ def looks_like_heading(text: str) -> bool:
     t = (text or "").strip()
     if not t:
         return False
-    words = t.split()
-    if len(words) < 1 or len(words) > 18:
+    if t.count(" ") + 1 > 18:   # word count without building a list (text is whitespace-normalized)
         return False
     if t.endswith("."):
         return False
@@ -47,44 +57,47 @@ def looks_like_heading(text: str) -> bool:
 
 
 def normalize_text(s: str) -> str:
-    s = re.sub(r"(\w)-\n(\w)", r"\1\2", s)            # join hyphenated breaks
-    s = re.sub(r"(?<!\n)\n(?!\n)", " ", s)            # single newlines -> spaces
-    s = re.sub(r"[ \t]+", " ", s)                     # collapse spaces/tabs
-    s = re.sub(r"\n{3,}", "\n\n", s)                  # collapse blank lines
+    s = _HYPHEN_RE.sub(r"\1\2", s)                    # join hyphenated breaks
+    s = _SINGLE_NL_RE.sub(" ", s)                     # single newlines -> spaces
+    s = _WS_RE.sub(" ", s)                            # collapse spaces/tabs
+    s = _BLANK_LINES_RE.sub("\n\n", s)                # collapse blank lines
     return s.strip()
 
 
-def page_body_font_size(page_dict: dict) -> float:
-    sizes = []
+def page_text_blocks(page_dict: dict):
+    """
+    Single pass over the text blocks of a page.
+    Returns ([(bbox, text, avg_size, any_bold), ...], body_font_size).
+    """
+    blocks = []
+    body_sizes = array("f")  # float32 buffer, no per-span Python float objects
+
     for b in page_dict.get("blocks", []):
         if b.get("type") != 0:
             continue
+
+        parts, sizes = [], []
+        fonts = set()
+
         for line in b.get("lines", []):
             for span in line.get("spans", []):
-                txt = (span.get("text") or "").strip()
+                txt = span.get("text") or ""
+                if txt:
+                    parts.append(txt)
                 sz = span.get("size")
-                if txt and isinstance(sz, (int, float)) and sz >= 6:
+                if isinstance(sz, (int, float)):
                     sizes.append(float(sz))
-    return median(sizes) if sizes else 0.0
-
+                    if sz >= 6 and txt.strip():
+                        body_sizes.append(sz)
+                fonts.add(span.get("font", ""))
 
-def block_text_and_style(block: dict):
-    parts, sizes = [], []
-    any_bold = False
+        any_bold = any(is_bold_font(f) for f in fonts)
+        text = "".join(parts).strip()
+        avg_size = (sum(sizes) / len(sizes)) if sizes else 0.0
+        blocks.append((b.get("bbox", None), text, avg_size, any_bold))
 
-    for line in block.get("lines", []):
-        for span in line.get("spans", []):
-            txt = span.get("text", "")
-            if txt:
-                parts.append(txt)
-            sz = span.get("size")
-            if isinstance(sz, (int, float)):
-                sizes.append(float(sz))
-            any_bold |= is_bold_font(span.get("font", ""))
-
-    text = "".join(parts).strip()
-    avg_size = (sum(sizes) / len(sizes)) if sizes else 0.0
-    return text, avg_size, any_bold
+    body_size = float(np.median(np.frombuffer(body_sizes, dtype=np.float32))) if body_sizes else 0.0
+    return blocks, body_size
 
 
 def classify_level(avg_size: float, body_size: float) -> str:
@@ -107,59 +120,46 @@ def is_header_footer_bbox(bbox, page_height: float) -> bool:
 def split_into_chunks(text: str, max_chars: int, overlap: int):
     """
     Simple character-based chunking with overlap, tries to split on paragraph boundaries first.
+    Chunks are slices of the input text, paragraphs are never re-concatenated.
     """
     t = text.strip()
     if len(t) <= max_chars:
         return [t]
 
-    paras = re.split(r"\n\s*\n", t)
-    chunks = []
-    buf = ""
-
-    def flush_buf():
-        nonlocal buf
-        if buf.strip():
-            chunks.append(buf.strip())
-        buf = ""
-
-    for p in paras:
-        p = p.strip()
-        if not p:
+    # paragraph (start, end) offsets between blank-line breaks
+    paras = []
+    start = 0
+    for m in _PARA_BREAK_RE.finditer(t):
+        paras.append((start, m.start()))
+        start = m.end()
+    paras.append((start, len(t)))
+    para_ends = [end for _, end in paras]
+
+    # greedily take as many whole paragraphs as fit into max_chars
+    spans = []
+    i = 0
+    while i < len(paras):
+        start = paras[i][0]
+        j = bisect_right(para_ends, start + max_chars, lo=i) - 1
+        if j >= i:
+            spans.append((start, paras[j][1]))
+            i = j + 1
             continue
-
-        candidate = (buf + "\n\n" + p).strip() if buf else p
-        if len(candidate) <= max_chars:
-            buf = candidate
-        else:
-            # flush what we have
-            flush_buf()
-            # if paragraph itself too big, hard-split it
-            if len(p) > max_chars:
-                start = 0
-                while start < len(p):
-                    end = min(start + max_chars, len(p))
-                    chunk = p[start:end].strip()
-                    if chunk:
-                        chunks.append(chunk)
-                    if end >= len(p):
-                        break
-                    start = max(0, end - overlap)
-            else:
-                buf = p
-
-    flush_buf()
-
-    # add overlap between chunks (only if overlap > 0 and multiple chunks)
-    if overlap > 0 and len(chunks) > 1:
-        overlapped = []
-        for i, ch in enumerate(chunks):
-            if i == 0:
-                overlapped.append(ch)
-            else:
-                prev = overlapped[-1]
-                tail = prev[-overlap:] if len(prev) > overlap else prev
-                overlapped.append((tail + ch).strip())
-        return overlapped
+        # paragraph itself too big, hard-split it
+        end = paras[i][1]
+        while start < end:
+            spans.append((start, min(start + max_chars, end)))
+            start += max_chars
+        i += 1
+
+    # overlap: each chunk after the first also starts `overlap` chars earlier
+    chunks = []
+    for k, (start, end) in enumerate(spans):
+        if k > 0 and overlap > 0:
+            start = max(0, start - overlap)
+        chunk = t[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
 
     return chunks
 
@@ -171,33 +171,32 @@ def pdf_to_qdrant_jsonl(pdf_path: str, out_jsonl: str):
     source_file = Path(pdf_path).name
     running_chunk_index = 0
 
-    doc = fitz.open(pdf_path)
-
-    with open(out_jsonl, "w", encoding="utf-8") as f_out:
+    with fitz.open(pdf_path, filetype="pdf") as doc, open(out_jsonl, "wb") as f_out:
         ctx = {"title": None, "h1": None, "h2": None}
 
         for page in doc:
             page_dict = page.get_text("dict")
-            body_size = page_body_font_size(page_dict)
+            blocks, body_size = page_text_blocks(page_dict)
             page_h = float(page.rect.height)
 
-            blocks = [b for b in page_dict.get("blocks", []) if b.get("type") == 0]
-            blocks.sort(key=lambda b: (b["bbox"][1], b["bbox"][0]))  # top-to-bottom
+            blocks.sort(key=lambda b: (b[0][1], b[0][0]))  # top-to-bottom
 
-            for b in blocks:
-                raw_text, avg_size, any_bold = block_text_and_style(b)
-                text = normalize_text(raw_text)
+            for bbox, raw_text, avg_size, any_bold in blocks:
+                # Classify by size first: heading-scale blocks only get their whitespace
+                # collapsed, the full normalize_text pass is reserved for body text
+                level = classify_level(avg_size, body_size)
+                if level == "body":
+                    text = normalize_text(raw_text)
+                else:
+                    text = _WS_RE.sub(" ", raw_text).strip()
                 if not text:
                     continue
 
-                bbox = b.get("bbox", None)
-
                 # Drop obvious header/footer noise unless it truly looks like a heading
                 if bbox and is_header_footer_bbox(bbox, page_h) and not looks_like_heading(text):
                     continue
 
-                level = classify_level(avg_size, body_size)
-                is_heading = level in ("title", "h1", "h2") and (any_bold or looks_like_heading(text))
+                is_heading = level != "body" and (any_bold or looks_like_heading(text))
 
                 if is_heading:
                     if level == "title":
@@ -210,11 +209,14 @@ def pdf_to_qdrant_jsonl(pdf_path: str, out_jsonl: str):
                     elif level == "h2":
                         ctx["h2"] = text
                     continue  # don't emit headings as body chunks (usually best for RAG)
+
+                if level != "body":
+                    text = normalize_text(raw_text)  # large but not a heading: treat as body
                 
                 # Emit body text chunks with current header context
                 for chunk_text in split_into_chunks(text, MAX_CHARS, OVERLAP_CHARS):
                     rec = {
-                        "id": str(uuid.uuid4()),
+                        "id": str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{source_file}#{page.number}#{running_chunk_index}")),
                         "text": chunk_text,
                         "metadata": {
                             "source_file": source_file,
@@ -226,10 +228,9 @@ def pdf_to_qdrant_jsonl(pdf_path: str, out_jsonl: str):
                             "chunk_index": running_chunk_index,
                         },
                     }
-                    f_out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                    f_out.write(orjson.dumps(rec) + b"\n")
                     running_chunk_index += 1
 
-    doc.close()
     return out_jsonl
 
 
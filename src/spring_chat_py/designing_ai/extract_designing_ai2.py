@@ -4,10 +4,12 @@ Created on 5 Feb 2026
 @author: ante
 '''
 import fitz  # PyMuPDF
-import json, os, sys, logging
+import orjson, os, sys, logging
 import uuid, hashlib
 import re
-from statistics import median
+import numpy as np
+from array import array
+from functools import lru_cache
 from pathlib import Path
 
 log = logging.getLogger(__name__)
@@ -22,46 +24,50 @@ HEADER_SCALE_H1 = 1.35
 HEADER_SCALE_H2 = 1.20
 TITLE_SCALE     = 1.75
 
+_HYPHEN_RE      = re.compile(r"(\w)-\n(\w)")
+_SINGLE_NL_RE   = re.compile(r"(?<!\n)\n(?!\n)")
+_WS_RE          = re.compile(r"[ \t]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
 
 def normalize_text(s: str) -> str:
-    s = re.sub(r"(\w)-\n(\w)", r"\1\2", s)
-    s = re.sub(r"(?<!\n)\n(?!\n)", " ", s)
-    s = re.sub(r"[ \t]+", " ", s)
-    s = re.sub(r"\n{3,}", "\n\n", s)
+    s = _HYPHEN_RE.sub(r"\1\2", s)
+    s = _SINGLE_NL_RE.sub(" ", s)
+    s = _WS_RE.sub(" ", s)
+    s = _BLANK_LINES_RE.sub("\n\n", s)
     return s.strip()
 
 
+@lru_cache(maxsize=256)
 def is_bold_font(font_name: str) -> bool:
     return "bold" in (font_name or "").lower()
 
 
-def page_body_font_size(page_dict):
-    sizes = []
+def page_text_blocks(page_dict):
+    # one pass: per-block (bbox, text, avg_size, bold) plus the page body font size
+    blocks = []
+    body_sizes = array("f")  # float32 buffer, no per-span Python float objects
     for b in page_dict.get("blocks", []):
         if b.get("type") != 0:
             continue
+        parts, sizes = [], []
+        fonts = set()
         for l in b.get("lines", []):
             for s in l.get("spans", []):
-                if (s.get("text") or "").strip():
-                    sz = s.get("size")
-                    if isinstance(sz, (int, float)):
-                        sizes.append(float(sz))
-    return median(sizes) if sizes else 0.0
-
-
-def block_text_and_style(block):
-    parts, sizes = [], []
-    bold = False
-    for l in block.get("lines", []):
-        for s in l.get("spans", []):
-            parts.append(s.get("text", ""))
-            sz = s.get("size")
-            if isinstance(sz, (int, float)):
-                sizes.append(float(sz))
-            bold |= is_bold_font(s.get("font", ""))
-    text = "".join(parts).strip()
-    avg_size = (sum(sizes) / len(sizes)) if sizes else 0.0
-    return text, avg_size, bold
+                txt = s.get("text") or ""
+                parts.append(txt)
+                sz = s.get("size")
+                if isinstance(sz, (int, float)):
+                    sizes.append(float(sz))
+                    if txt.strip():
+                        body_sizes.append(sz)
+                fonts.add(s.get("font", ""))
+        bold = any(is_bold_font(f) for f in fonts)
+        text = "".join(parts).strip()
+        avg_size = (sum(sizes) / len(sizes)) if sizes else 0.0
+        blocks.append((b["bbox"], text, avg_size, bold))
+    body_size = float(np.median(np.frombuffer(body_sizes, dtype=np.float32))) if body_sizes else 0.0
+    return blocks, body_size
 
 
 def classify(avg_size, body_size):
@@ -97,21 +103,17 @@ def short_hash(text: str) -> str:
 
 def extract_all_text(pdf_path, out_jsonl):
     source_file = Path(pdf_path).name
-    doc = fitz.open(pdf_path)
-
     ctx = {"title": None, "h1": None, "h2": None}
     chunk_index = 0
 
-    with open(out_jsonl, "w", encoding="utf-8") as f:
+    with fitz.open(pdf_path, filetype="pdf") as doc, open(out_jsonl, "wb") as f:
         for page in doc:
             page_dict = page.get_text("dict")
-            body_size = page_body_font_size(page_dict)
+            blocks, body_size = page_text_blocks(page_dict)
 
-            blocks = [b for b in page_dict.get("blocks", []) if b.get("type") == 0]
-            blocks.sort(key=lambda b: (b["bbox"][1], b["bbox"][0]))  # reading order
+            blocks.sort(key=lambda b: (b[0][1], b[0][0]))  # reading order
 
-            for block_index, b in enumerate(blocks):
-                raw, avg_size, bold = block_text_and_style(b)
+            for block_index, (bbox, raw, avg_size, bold) in enumerate(blocks):
                 text = normalize_text(raw)
                 if not text:
                     continue
@@ -133,7 +135,7 @@ def extract_all_text(pdf_path, out_jsonl):
 
                 for part_index, chunk in enumerate(split_chunks(text, MAX_CHARS, OVERLAP_CHARS)):
                     record = {
-                        "id": str(uuid.uuid4()),
+                        "id": str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{source_file}#{page.number}#{chunk_index}")),
                         "text": chunk,
                         "metadata": {
                             "source_file": source_file,
@@ -151,11 +153,9 @@ def extract_all_text(pdf_path, out_jsonl):
                             "chunk_index": chunk_index,
                         },
                     }
-                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    f.write(orjson.dumps(record) + b"\n")
                     chunk_index += 1
 
-    doc.close()
-
 
 def create_extracts(scan_dir: str, chunk_dir: str):
     if not os.path.isdir(scan_dir):
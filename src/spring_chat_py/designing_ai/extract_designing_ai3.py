@@ -4,12 +4,14 @@ Created on 5 Feb 2026
 @author: ante
 '''
 import fitz  # PyMuPDF
-import json, os, sys, logging
+import orjson, os, sys, logging
 import uuid, hashlib
 import re, requests
-from statistics import median
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from requests.adapters import HTTPAdapter
 from pathlib import Path
-from typing import List, Dict, Any
+from itertools import islice
+from typing import List, Dict, Any, BinaryIO, Iterator, Tuple
 from spring_chat_py.embeddings import embed_chunks
 
 log = logging.getLogger(__name__)
@@ -20,53 +22,78 @@ def short_hash(text: str) -> str:
     return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
 
 
-def extract_all_text(pdf_path) -> List[Dict[str, Any]]:
+def extract_all_text(pdf_path) -> Iterator[Dict[str, Any]]:
+    # yields one record per page, so callers only hold the pages they are working on
     source_file = Path(pdf_path).name
-    doc = fitz.open(pdf_path)
 
-    records: List[Dict[str, Any]] = []
-
-    for page in doc:
-        text = page.get_text("text")
-        #log.info(text)
-        record = {
-                    "id": str(uuid.uuid4()),
+    with fitz.open(pdf_path, filetype="pdf") as doc:
+        for page in doc:
+            text = page.get_text("text")
+            #log.info(text)
+            yield {
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{source_file}#{page.number}")),
                     "text": text,
                     "metadata": {
                         "source_file": source_file,
                         "page": page.number + 1,
                     },
                 }
-        #f.write(json.dumps(record, ensure_ascii=False) + "\n")
-        records.append(record)
-    doc.close()
-    return  records
 
 OLLAMA_URL = "http://localhost:11434/api/embed"
 
+# concurrent embedding batches in flight against Ollama
+OLLAMA_MAX_WORKERS = int(os.environ.get("OLLAMA_MAX_WORKERS", "2"))
+
+# one pooled keep-alive session for all Ollama calls; Ollama serves plain
+# HTTP/1.1 (no h2c), so concurrency comes from one pooled connection per worker
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=max(32, OLLAMA_MAX_WORKERS), max_retries=0))
+
+
+def _post_embed(inputs: List[str], model: str) -> List[List[float]]:
+    payload = {"model": model, "input": inputs}
+    #log.debug("payload: %s", payload)
+    # Embeddings API: input can be a list of strings
+    resp = _SESSION.post(OLLAMA_URL, json=payload, timeout=60)
+    resp.raise_for_status()
+    log.debug("response: %s", resp)
+    #log.debug("body: %s", resp.json())
+    return resp.json()["embeddings"]
+
+
+def _post_batch(b: int, inputs: List[str], model: str) -> Tuple[int, List[List[float]]]:
+    embs = _post_embed(inputs, model)
+    if len(embs) != len(inputs):
+        # safety net: fall back to one request per text
+        log.warning("Embedding count mismatch: got %d embeddings for %d inputs, retrying per text", len(embs), len(inputs))
+        embs = [_post_embed([text], model)[0] for text in inputs]
+    return b, embs
+
 
 def embed_chunks(chunks: List[Dict[str, Any]], model: str = "bge-m3", batch_size: int = 64) -> None:
     log.debug("embed_chunks")
-    for b in range(0, len(chunks), batch_size):
-        batch = chunks[b : b + batch_size]
-        inputs = [c["text"] for c in batch]
-        payload = {"model": model, "input": inputs}
-        #log.debug("payload: %s", payload)
-        #log.debug("")
-        # Embeddings API: input can be a list of strings
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=60)
-        resp.raise_for_status()
-        log.debug("response: %s", resp)
-        #log.debug("body: %s", resp.json())
-        log.debug("")
-        # resp.data aligns with inputs order
-        for item, emb in zip(batch, resp.json()["embeddings"]):
+    batches = [(b, chunks[b : b + batch_size]) for b in range(0, len(chunks), batch_size)]
+    results: Dict[int, List[List[float]]] = {}
+    with ThreadPoolExecutor(max_workers=OLLAMA_MAX_WORKERS) as executor:
+        futures = [executor.submit(_post_batch, b, [c["text"] for c in batch], model) for b, batch in batches]
+        for future in as_completed(futures):
+            b, embs = future.result()
+            results[b] = embs
+    for b, batch in batches:
+        # embeddings align with inputs order
+        for item, emb in zip(batch, results[b]):
             item["embedding_model"] = model
             item["embeddings"] = emb
     
 
 
-def create_extracts(scan_dir: str, chunk_dir: str):
+def _embed_and_write(records: List[Dict[str, Any]], f: BinaryIO, batch_size: int) -> None:
+    embed_chunks(records, batch_size=batch_size)
+    for record in records:
+        f.write(orjson.dumps(record) + b"\n")
+
+
+def create_extracts(scan_dir: str, chunk_dir: str, batch_size: int = 64):
     if not os.path.isdir(scan_dir):
         log.info(f"Scan directory not found: {scan_dir}", file=sys.stderr)
         sys.exit(2)
@@ -79,18 +106,36 @@ def create_extracts(scan_dir: str, chunk_dir: str):
         log.info(f"No PDF files found in {scan_dir}", file=sys.stderr)
         sys.exit(1)
         
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(scan_dir, pdf_file)
-        out_path = os.path.join(
-            chunk_dir,
-            os.path.splitext(pdf_file)[0] + ".jsonl"
-        )
-        with open(out_path, "w", encoding="utf-8") as f:
+    # embed + write on a background thread, so Ollama works on one group of
+    # pages while PyMuPDF decodes the next one; each group holds one embed
+    # batch per Ollama worker, so all of them are in flight at once and at
+    # most two groups are alive
+    group_size = batch_size * OLLAMA_MAX_WORKERS
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for pdf_file in pdf_files:
+            pdf_path = os.path.join(scan_dir, pdf_file)
+            out_path = os.path.join(
+                chunk_dir,
+                os.path.splitext(pdf_file)[0] + ".jsonl"
+            )
             log.info(f"Processing {pdf_file} ...")
-            records = extract_all_text(pdf_path)
-            log.debug("records length: %s", len(records))
-            embed_chunks(records)
-            for record in records:
-                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            with open(out_path, "wb") as f:
+                pages = extract_all_text(pdf_path)
+                n_records = 0
+                pending = None
+                try:
+                    while records := list(islice(pages, group_size)):
+                        n_records += len(records)
+                        if pending is not None:
+                            pending.result()
+                        pending = writer.submit(_embed_and_write, records, f, batch_size)
+                finally:
+                    # the last write must finish before f closes, also when
+                    # extraction raised; wait() keeps the original error
+                    if pending is not None:
+                        wait((pending,))
+                if pending is not None:
+                    pending.result()
+            log.debug("records length: %s", n_records)
         
     log.info("Done.")
\ No newline at end of file
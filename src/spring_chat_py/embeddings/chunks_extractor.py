@@ -5,10 +5,16 @@ Created on 30 Jan 2026
 '''
 from __future__ import annotations
 
-import os, sys, re, json, uuid, logging
-from typing import List, Dict, Any, Tuple, Optional
+import os, sys, re, uuid, logging
+from array import array
+from statistics import median_high
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from typing import List, Dict, Any, Tuple, Optional, Iterator
 
 import fitz  # PyMuPDF
+import numpy as np
+import orjson
 
 log = logging.getLogger(__name__)
 
@@ -18,6 +24,18 @@ log = logging.getLogger(__name__)
 
 _HYPHEN_LINEBREAK_RE = re.compile(r"(\w)-\s*\n\s*(\w)")
 _WS_RE = re.compile(r"[ \t]+")
+_NL3_RE = re.compile(r"\n{3,}")
+
+# default "dict" flags minus images: MuPDF then skips image decoding and
+# no binary image blocks are built for the Python side
+_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# line texts shorter than this are interned: running headers/footers repeat on
+# every page and then share one str object with a cached hash
+_INTERN_MAX_LEN = 256
+
+# rows serialized per writelines() call, caps the bytes held for big embedding files
+_WRITE_BATCH = 1024
 
 
 def _dehyphenate(text: str) -> str:
@@ -31,21 +49,27 @@ def _normalize(text: str) -> str:
     text = text.replace("\r", "\n")
     text = _WS_RE.sub(" ", text)
     # collapse excessive newlines, but keep paragraph boundaries
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = _NL3_RE.sub("\n\n", text)
     return text.strip()
 
 
+def _is_page_number(s: str) -> bool:
+    # "12" or "3 / 12" on stripped text, plain str checks instead of a regex
+    a, sep, b = s.partition("/")
+    if not sep:
+        return s.isdecimal()
+    return a.rstrip().isdecimal() and b.lstrip().isdecimal()
+
+
 def _looks_like_header_footer(line: str) -> bool:
     s = line.strip()
     if not s:
         return True
-    # Very common noise patterns
-    if re.fullmatch(r"page\s*\d+(\s*/\s*\d+)?", s, flags=re.IGNORECASE):
-        return True
-    if re.fullmatch(r"\d+\s*/\s*\d+", s):
-        return True
-    if re.fullmatch(r"\d+", s):
+    # Very common noise patterns: "3", "3 / 12", "Page 3", "page 3/12"
+    if _is_page_number(s):
         return True
+    if s[:4].lower() == "page":
+        return _is_page_number(s[4:].lstrip())
     return False
 
 
@@ -70,7 +94,7 @@ def _iter_lines_with_style(page: fitz.Page) -> List[Dict[str, Any]]:
     - bbox (x0,y0,x1,y1)
     - avg_font_size (float)
     """
-    d = page.get_text("dict")
+    d = page.get_text("dict", flags=_TEXT_FLAGS)
     lines_out: List[Dict[str, Any]] = []
 
     for block in d.get("blocks", []):
@@ -83,19 +107,19 @@ def _iter_lines_with_style(page: fitz.Page) -> List[Dict[str, Any]]:
             text = "".join(s.get("text", "") for s in spans).strip()
             if not text:
                 continue
+            if len(text) < _INTERN_MAX_LEN:
+                text = sys.intern(text)
 
-            # Weighted average font size by span length
-            sizes = []
-            weights = []
+            # Weighted average font size by span length, in one pass
+            weighted = 0.0
+            total_w = 0
             for s in spans:
                 t = s.get("text", "")
                 if not t:
                     continue
-                sizes.append(float(s.get("size", 0.0)))
-                weights.append(len(t))
-            avg_size = 0.0
-            if sizes and weights:
-                avg_size = sum(sz * w for sz, w in zip(sizes, weights)) / max(1, sum(weights))
+                weighted += float(s.get("size", 0.0)) * len(t)
+                total_w += len(t)
+            avg_size = weighted / total_w if total_w else 0.0
 
             lines_out.append(
                 {
@@ -148,21 +172,28 @@ def _detect_header_footer_zones(
     return header_texts, footer_texts
 
 
-def _is_heading(line: Dict[str, Any], body_font_size: float, heading_ratio: float = 1.25) -> bool:
-    # Heuristic: larger font and not too long
-    txt = line["text"].strip()
-    if len(txt) > 140:
-        return False
-    return line["avg_font_size"] >= body_font_size * heading_ratio
-
-
-def _compute_body_font_size(all_lines: List[Dict[str, Any]]) -> float:
-    # Robust-ish: median of font sizes
-    sizes = [ln["avg_font_size"] for ln in all_lines if ln["avg_font_size"] > 0]
+def _compute_body_font_size(sizes: array) -> float:
+    # Robust-ish: median of font sizes (upper median, as sorted(sizes)[n // 2]),
+    # selected in O(n) without sorting
     if not sizes:
         return 10.0
-    sizes.sort()
-    return sizes[len(sizes) // 2]
+    arr = np.frombuffer(sizes, dtype=np.float64)
+    k = arr.size // 2
+    return float(np.partition(arr, k)[k])
+
+
+def _join_tail(parts: List[str], n: int) -> str:
+    # "\n".join(parts)[-n:] for n > 0, joining only the trailing parts it needs
+    picked: List[str] = []
+    size = 0
+    for p in reversed(parts):
+        picked.append(p)
+        size += len(p)
+        if size >= n:
+            break
+        size += 1  # "\n" before p
+    picked.reverse()
+    return "\n".join(picked)[-n:]
 
 
 def _split_into_chunks(
@@ -171,25 +202,24 @@ def _split_into_chunks(
     overlap_chars: int
 ) -> List[Dict[str, Any]]:
     """
-    blocks: list of dicts with 'text', and optional metadata
+    blocks: list of dicts with 'id', 'metadata' and 'text'
     Returns list of chunk dicts with combined text and inherited metadata.
     """
     chunks: List[Dict[str, Any]] = []
     cur: List[str] = []
-    cur_meta = None
+    cur_block = None  # block the current chunk inherits id/metadata from
     cur_len = 0
 
     def flush():
-        nonlocal cur, cur_meta, cur_len
+        nonlocal cur, cur_block, cur_len
         if not cur:
             return
-        text = _normalize("\n".join(cur))
+        # paragraphs are normalized when their blocks are built
+        text = "\n".join(cur).strip()
         if text:
-            out = dict(cur_meta or {})
-            out["text"] = text
-            chunks.append(out)
+            chunks.append({"id": cur_block["id"], "metadata": cur_block["metadata"], "text": text})
         cur = []
-        cur_meta = None
+        cur_block = None
         cur_len = 0
 
     for b in blocks:
@@ -200,27 +230,26 @@ def _split_into_chunks(
         # If this is a heading, flush current chunk first and start new section context
         if b.get("is_heading"):
             flush()
-            cur_meta = {k: v for k, v in b.items() if k != "text"}
+            cur_block = b
             cur.append(t)
             cur_len = len(t)
             continue
 
-        if cur_meta is None:
-            cur_meta = {k: v for k, v in b.items() if k != "text"}
+        if cur_block is None:
+            cur_block = b
 
         # Add paragraph, flush if too large
         if cur_len + len(t) + 2 > max_chars:
             # create overlap by keeping the tail of current text
             if overlap_chars > 0 and cur:
-                joined = "\n".join(cur)
-                tail = joined[-overlap_chars:]
+                tail = _join_tail(cur, overlap_chars)
                 flush()
-                cur_meta = {k: v for k, v in b.items() if k != "text"}
+                cur_block = b
                 cur = [tail, t]
                 cur_len = len(tail) + len(t)
             else:
                 flush()
-                cur_meta = {k: v for k, v in b.items() if k != "text"}
+                cur_block = b
                 cur = [t]
                 cur_len = len(t)
         else:
@@ -242,7 +271,7 @@ def extract_chunks_from_pdf(
     overlap_chars: int = 200,
     heading_ratio: float = 1.25,
     remove_repeating_headers_footers: bool = True,
-) -> List[Dict[str, Any]]:
+) -> Iterator[Dict[str, Any]]:
     
     #print("chunk_extracto.extrac_chunks_from_pdf")
     #print("pdf_path: ", pdf_path)
@@ -255,33 +284,39 @@ def extract_chunks_from_pdf(
     - Chunks along paragraph/heading boundaries (not raw fixed windows)
     - Keeps citations: source_file + page (+ optional section heading)
 
-    Returns: List[Dict[str, Any]] with keys:
+    Two passes: the first reads every page and keeps its lines (document-wide
+    body font size and header/footer texts), the second chunks page by page,
+    yields as it goes and drops each page's lines once chunked. The lines of
+    the whole document are still held after pass 1; what is saved is the
+    list of all chunks, unless the caller builds one.
+
+    Yields: Dict[str, Any] with keys:
       - source_file, page, chunk_index, text
       - section (optional, inferred from headings)
     """
-    doc = fitz.open(pdf_path)
     source_file = os.path.basename(pdf_path)
 
     # Pre-extract lines per page (needed to detect repeating headers/footers)
     lines_per_page: List[List[Dict[str, Any]]] = []
     page_heights: List[float] = []
-    all_lines_flat: List[Dict[str, Any]] = []
-
-    for pi in range(doc.page_count):
-        page = doc.load_page(pi)
-        page_heights.append(float(page.rect.height))
-        lines = _iter_lines_with_style(page)
-        lines_per_page.append(lines)
-        all_lines_flat.extend(lines)
-
-    body_font = _compute_body_font_size(all_lines_flat)
+    # positive line font sizes of the whole document, no flattened copy of the lines
+    font_sizes = array("d")
+
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            page_heights.append(float(page.rect.height))
+            lines = _iter_lines_with_style(page)
+            lines_per_page.append(lines)
+            font_sizes.extend(ln["avg_font_size"] for ln in lines if ln["avg_font_size"] > 0)
+
+    body_font = _compute_body_font_size(font_sizes)
+    heading_thr = body_font * heading_ratio
     header_texts, footer_texts = (set(), set())
     if remove_repeating_headers_footers and page_heights:
         # Use median page height for thresholds
-        ph = sorted(page_heights)[len(page_heights) // 2]
+        ph = median_high(page_heights)
         header_texts, footer_texts = _detect_header_footer_zones(lines_per_page, ph)
 
-    out_chunks: List[Dict[str, Any]] = []
     running_chunk_index = 0
     current_section: Optional[str] = None
 
@@ -324,9 +359,8 @@ def extract_chunks_from_pdf(
                 # keep only if not obviously just page numbering etc.
                 continue
 
-            # Heading detection (font size)
-            is_head = _is_heading(ln, body_font, heading_ratio=heading_ratio)
-            if is_head:
+            # Heading detection (font size): larger font and not too long
+            if len(t) <= 140 and ln["avg_font_size"] >= heading_thr:
                 flush_para()
                 current_section = t  # section heading for later chunks
                 blocks.append(
@@ -352,6 +386,7 @@ def extract_chunks_from_pdf(
             prev_y1 = y1
 
         flush_para()
+        lines.clear()  # this page's line dicts are not needed any more
 
         # Chunk across the page's blocks (keeps section metadata)
         page_chunks = _split_into_chunks(blocks, max_chars=max_chars, overlap_chars=overlap_chars)
@@ -359,9 +394,28 @@ def extract_chunks_from_pdf(
         for ch in page_chunks:
             ch.setdefault("metadata", {})["chunk_index"] = running_chunk_index
             running_chunk_index += 1
-            out_chunks.append(ch)
-
-    return out_chunks
+            yield ch
+
+
+def _process_one(pdf_path: str, out_path: str) -> int:
+    # runs in a worker process, which opens its own fitz.Document
+    pdf_file = os.path.basename(pdf_path)
+    log.info(f"Processing {pdf_file} ...")
+    chunks = extract_chunks_from_pdf(pdf_path)
+    first = next(chunks, None)
+    if first is None:
+        log.info(f"  ⚠️  No text found in {pdf_file}, skipping")
+        return 0
+
+    # stream the generator to disk, at most _WRITE_BATCH chunks are held
+    n_chunks = 0
+    rows = chain((first,), chunks)
+    with open(out_path, "wb") as f:
+        while batch := list(islice(rows, _WRITE_BATCH)):
+            f.writelines([orjson.dumps(row) + b"\n" for row in batch])
+            n_chunks += len(batch)
+    log.info(f"  ✔ Wrote {n_chunks} chunks → {out_path}")
+    return n_chunks
 
 
 def create_chunks(scan_dir: str, chunk_dir: str):
@@ -376,20 +430,12 @@ def create_chunks(scan_dir: str, chunk_dir: str):
     if not pdf_files:
         log.info(f"No PDF files found in {scan_dir}", file=sys.stderr)
         sys.exit(1)
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(scan_dir, pdf_file)
-        out_path = os.path.join(
-            chunk_dir,
-            os.path.splitext(pdf_file)[0] + ".jsonl"
-        )
-        log.info(f"Processing {pdf_file} ...")
-        chunks = extract_chunks_from_pdf(pdf_path)
-        if not chunks:
-            log.info(f"  ⚠️  No text found in {pdf_file}, skipping")
-            continue
-
-        with open(out_path, "w", encoding="utf-8") as f:
-            for row in chunks:
-                f.write(json.dumps(row, ensure_ascii=False) + "\n")
-        log.info(f"  ✔ Wrote {len(chunks)} chunks → {out_path}")
+    pdf_paths = [os.path.join(scan_dir, pdf_file) for pdf_file in pdf_files]
+    out_paths = [
+        os.path.join(chunk_dir, os.path.splitext(pdf_file)[0] + ".jsonl")
+        for pdf_file in pdf_files
+    ]
+    # one PDF per worker process, PyMuPDF parsing runs on all cores
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(pdf_files))) as ex:
+        list(ex.map(_process_one, pdf_paths, out_paths))
     log.info("Done.")
@@ -14,9 +14,14 @@ Usage:
   python pdf_embed.py input.pdf output.jsonl
 """
 
-import os, sys, json, logging
-from typing import List, Dict, Any
+import os, sys, logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Tuple
+import numpy as np
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from spring_chat_py.embeddings.chunks_extractor import extract_chunks_from_pdf
 
 
@@ -24,28 +29,82 @@ log = logging.getLogger(__name__)
 
 OLLAMA_URL = "http://localhost:11434/api/embed"
 
+# concurrent embedding batches in flight against Ollama
+OLLAMA_MAX_WORKERS = int(os.environ.get("OLLAMA_MAX_WORKERS", "2"))
+
+# rows serialized per writelines() call, caps the bytes held for big embedding files
+_WRITE_BATCH = 1024
+
+# one pooled keep-alive session for all Ollama calls; Ollama serves plain
+# HTTP/1.1 (no h2c), so concurrency comes from one pooled connection per worker;
+# failed connects are retried twice with a short backoff
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=max(32, OLLAMA_MAX_WORKERS), max_retries=Retry(total=2, backoff_factor=0.1)))
+
+
+def _post_embed(inputs: List[str], model: str) -> List[List[float]]:
+    payload = {"model": model, "input": inputs}
+    #log.debug("payload: %s", payload)
+    # Embeddings API: input can be a list of strings
+    resp = _SESSION.post(OLLAMA_URL, json=payload, timeout=60)
+    resp.raise_for_status()
+    log.debug("response: %s", resp)
+    #log.debug("body: %s", resp.json())
+    return resp.json()["embeddings"]
+
+
+def _post_batch(b: int, inputs: List[str], model: str) -> Tuple[int, List[List[float]]]:
+    embs = _post_embed(inputs, model)
+
+    if len(embs) != len(inputs):
+        # safety net: fall back to one request per text
+        log.warning("Embedding count mismatch: got %d embeddings for %d inputs, retrying per text", len(embs), len(inputs))
+        embs = [_post_embed([text], model)[0] for text in inputs]
+
+    return b, embs
 
 
 def embed_chunks(chunks: List[Dict[str, Any]], model: str = "bge-m3", batch_size: int = 64) -> None:
     log.debug("embed_chunks")
-    for b in range(0, len(chunks), batch_size):
-        batch = chunks[b : b + batch_size]
-        inputs = [c["text"] for c in batch]
-        payload = {"model": model, "input": inputs}
-        #log.debug("payload: %s", payload)
-        #log.debug("")
-        # Embeddings API: input can be a list of strings
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=60)
-        resp.raise_for_status()
-        log.debug("response: %s", resp)
-        #log.debug("body: %s", resp.json())
-        log.debug("")
-        # resp.data aligns with inputs order
-        for item, emb in zip(batch, resp.json()["embeddings"]):
+    batches = [(b, chunks[b : b + batch_size]) for b in range(0, len(chunks), batch_size)]
+    results: Dict[int, np.ndarray] = {}
+    with ThreadPoolExecutor(max_workers=OLLAMA_MAX_WORKERS) as executor:
+        futures = [executor.submit(_post_batch, b, [c["text"] for c in batch], model) for b, batch in batches]
+        for future in as_completed(futures):
+            b, embs = future.result()
+            # one float32 matrix per batch instead of boxed Python floats
+            results[b] = np.asarray(embs, dtype=np.float32)
+    for b, batch in batches:
+        # embeddings align with inputs order, each item gets a float32 row
+        for item, emb in zip(batch, results[b]):
             item["embedding_model"] = model
             item["embeddings"] = emb
     
 
+def _extract_one(pdf_path: str) -> List[Dict[str, Any]]:
+    # runs in a worker process, which opens its own fitz.Document; a generator
+    # cannot be sent back to the parent, so the whole document's chunks are
+    # collected here and embedded there
+    return list(extract_chunks_from_pdf(pdf_path))
+
+
+def _embed_and_write(pdf_file: str, chunks: List[Dict[str, Any]], out_path: str) -> int:
+    # runs in the parent, so Ollama only ever sees OLLAMA_MAX_WORKERS requests
+    log.info(f"Processing {pdf_file} ...")
+    if not chunks:
+        log.info(f"  ⚠️  No text found in {pdf_file}, skipping")
+        return 0
+    ##################################################################
+    # ------------> commented out as this request like costs money
+    #               only activate when really needed
+    embed_chunks(chunks)
+    with open(out_path, "wb") as f:
+        for i in range(0, len(chunks), _WRITE_BATCH):
+            f.writelines([orjson.dumps(row, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n" for row in chunks[i : i + _WRITE_BATCH]])
+    log.info(f"  ✔ Wrote {len(chunks)} chunks → {out_path}")
+    return len(chunks)
+
+
 def create_embeddings(scan_dir: str, embedding_dir: str):
     log.info("create embeddings")
     if not os.path.isdir(scan_dir):
@@ -60,25 +119,17 @@ def create_embeddings(scan_dir: str, embedding_dir: str):
     if not pdf_files:
         log.info(f"No PDF files found in {scan_dir}", file=sys.stderr)
         sys.exit(1)
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(scan_dir, pdf_file)
-        out_path = os.path.join(
-            embedding_dir,
-            os.path.splitext(pdf_file)[0] + ".jsonl"
-        )
-        log.info(f"Processing {pdf_file} ...")
-        chunks = extract_chunks_from_pdf(pdf_path)
-        if not chunks:
-            print(f"  ⚠️  No text found in {pdf_file}, skipping")
-            continue
-        ##################################################################
-        # ------------> commented out as this request like costs money
-        #               only activate when really needed
-        embed_chunks(chunks)
-        with open(out_path, "w", encoding="utf-8") as f:
-            for row in chunks:
-                f.write(json.dumps(row, ensure_ascii=False) + "\n")
-        log.info(f"  ✔ Wrote {len(chunks)} chunks → {out_path}")
+    pdf_paths = [os.path.join(scan_dir, pdf_file) for pdf_file in pdf_files]
+    out_paths = [
+        os.path.join(embedding_dir, os.path.splitext(pdf_file)[0] + ".jsonl")
+        for pdf_file in pdf_files
+    ]
+    # PDF extraction runs in worker processes on all cores; embedding stays in
+    # this process with the one bounded thread pool, while the workers move on
+    # to the next PDFs
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(pdf_files))) as ex:
+        for pdf_file, out_path, chunks in zip(pdf_files, out_paths, ex.map(_extract_one, pdf_paths)):
+            _embed_and_write(pdf_file, chunks, out_path)
     log.info("Done.")
     
 
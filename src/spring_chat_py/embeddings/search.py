@@ -5,6 +5,8 @@ Created on 1 Feb 2026
 '''
 
 import requests, logging
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qm
 
@@ -12,6 +14,10 @@ log = logging.getLogger(__name__)
 
 OLLAMA_URL = "http://localhost:11434/api/embed"
 
+# one pooled keep-alive session for all Ollama calls, retries failed connects
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=32, max_retries=Retry(total=2, backoff_factor=0.1)))
+
 client = QdrantClient(url="http://localhost:6333")  # or Qdrant Cloud URL + api_key
  
 
@@ -21,7 +27,7 @@ def search(collection_name: str, query_text: str, top_k: int=3, model: str = "bg
         #log.debug("payload: %s", payload)
         #log.debug("")
         # Embeddings API: input can be a list of strings
-    resp = requests.post(OLLAMA_URL, json=payload, timeout=60)
+    resp = _SESSION.post(OLLAMA_URL, json=payload, timeout=60)
     resp.raise_for_status()
     log.debug("response: %s", resp)
     query_emeddings = resp.json()["embeddings"]
@@ -30,12 +36,14 @@ def search(collection_name: str, query_text: str, top_k: int=3, model: str = "bg
     
     #query_vector = [0.1, 0.2, 0.3, ...]  # your embedding (same dim as collection vectors)
      
-    hits = client.search(
+    hits = client.query_points(
         collection_name=collection_name,
-        query_vector=query_emeddings[0],
+        query=query_emeddings[0],
         limit=5,
         with_payload=True,
-    )
+        # int8 quantized candidates, rescored against the original vectors
+        search_params=qm.SearchParams(quantization=qm.QuantizationSearchParams(rescore=True)),
+    ).points
     
     for h in hits[:top_k]:
         log.info("****************************************************************")
@@ -7,18 +7,22 @@ from __future__ import annotations
 
 from qdrant_client import QdrantClient
 from qdrant_client.models import VectorParams, Distance
+from qdrant_client.models import ScalarQuantization, ScalarQuantizationConfig, ScalarType
 from qdrant_client.models import PointStruct
 from pathlib import Path
-import logging, json
+import logging, mmap
+import orjson
 
-from itertools import islice
-from typing import Any, Dict, Iterable, Iterator, List, Optional
+from typing import Any, Dict, Iterator, Optional
 
 #from qdrant_client import QdrantClient
 #from qdrant_client.models import Distance, PointStruct, VectorParams
 
 log = logging.getLogger(__name__)
 
+QDRANT_URL = "http://localhost:6333"
+QDRANT_GRPC_PORT = 6334
+
 def iter_jsonl_points(
     jsonl_dir: str,
     *,
@@ -41,14 +45,16 @@ def iter_jsonl_points(
       }
     """
     for file_path in sorted(Path(jsonl_dir).glob("*.jsonl")):
-        with file_path.open("r", encoding="utf-8") as f:
-            log.info("file: %s", file_path)
-            for line_no, line in enumerate(f, start=1):
-                line = line.strip()
-                if not line:
+        log.info("file: %s", file_path)
+        if file_path.stat().st_size == 0:
+            continue  # mmap cannot map an empty file
+        # map the file and parse the raw bytes of each line, no text decoding step
+        with file_path.open("rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line_no, line in enumerate(iter(mm.readline, b""), start=1):
+                if not line.strip():
                     continue
 
-                data: Dict[str, Any] = json.loads(line)
+                data: Dict[str, Any] = orjson.loads(line)
 
                 if id_field not in data:
                     raise ValueError(f"Missing '{id_field}' in {file_path}:{line_no}")
@@ -74,15 +80,11 @@ def iter_jsonl_points(
                 if "embedding_model" in data:
                     payload.setdefault("embedding_model", data["embedding_model"])
 
+                # vec stays the list orjson parsed: PointStruct validates vectors into
+                # list[float] anyway, a float32 array would only add a round trip
                 yield PointStruct(id=pid, vector=vec, payload=payload)
 
 
-def batched(it: Iterable[PointStruct], batch_size: int) -> Iterator[List[PointStruct]]:
-    it = iter(it)
-    while batch := list(islice(it, batch_size)):
-        yield batch
-
-
 def ensure_collection(
     client: QdrantClient,
     collection_name: str,
@@ -104,7 +106,11 @@ def ensure_collection(
     if not exists:
         client.create_collection(
             collection_name=collection_name,
-            vectors_config=VectorParams(size=vector_size, distance=distance),
+            # raw float32 vectors live on disk (rescoring only), int8 copies stay in RAM for search
+            vectors_config=VectorParams(size=vector_size, distance=distance, on_disk=True),
+            quantization_config=ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+            ),
         )
 
 
@@ -116,7 +122,7 @@ def upload_jsonl_dir(
     batch_size: int = 256,
 ) -> None:
     """
-    Uploads JSONL directory into Qdrant using batched upserts.
+    Uploads JSONL directory into Qdrant, batches are pipelined by upload_points.
     """
     point_iter = iter_jsonl_points(jsonl_dir)
 
@@ -136,12 +142,20 @@ def upload_jsonl_dir(
         yield first_point  # type: ignore[misc]
         yield from point_iter
 
-    for points in batched(chain_first(), batch_size):
-        client.upsert(collection_name=collection_name, points=points)
+    # batching, parallel workers and retries are handled by the client
+    client.upload_points(
+        collection_name=collection_name,
+        points=chain_first(),
+        batch_size=batch_size,
+        parallel=4,
+        wait=False,
+        max_retries=3,
+    )
 
 
 def upload(collection_name: str, in_dir: str):
-    client = QdrantClient(url="http://localhost:6333")
+    # gRPC: protobuf vectors instead of JSON floats
+    client = QdrantClient(url=QDRANT_URL, prefer_grpc=True, grpc_port=QDRANT_GRPC_PORT)
 
     upload_jsonl_dir(
         client=client,
@@ -6,33 +6,61 @@ Created on 29 Jan 2026
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import json
+import os
 import re
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from collections import Counter
-from typing import Any, Dict, List, Optional
+from array import array
+from collections import deque
+from operator import attrgetter
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import fitz  # PyMuPDF
+import numpy as np
+import orjson
 
 
-RE_MODULE = re.compile(r"^(module|modul)\s+\d+\b", re.IGNORECASE)
-RE_STEP = re.compile(r"^step\s+\d+\b", re.IGNORECASE)
-RE_CHAPTER = re.compile(r"^(chapter|kapitel)\s+\d+\b", re.IGNORECASE)
-RE_NUMBERED = re.compile(r"^\d+(\.\d+){0,8}\b")  # 1, 1.2, 1.2.3...
+# "Module 3", "Chapter 2", "Step 4", "1" / "1.2" / "1.2.3"... in one match,
+# m.lastgroup names the kind
+RE_HEADING_PREFIX = re.compile(
+    r"^(?:(?P<module>module|modul)\s+\d+"
+    r"|(?P<chapter>chapter|kapitel)\s+\d+"
+    r"|(?P<step>step)\s+\d+"
+    r"|(?P<numbered>\d+(?:\.\d+){0,8}))\b",
+    re.IGNORECASE,
+)
+# first characters RE_HEADING_PREFIX can match besides digits; IGNORECASE also
+# folds the Kelvin sign to k and the long s to s
+_PREFIX_FIRST_CHARS = frozenset("mMcCkKsS\u212a\u017f")
+RE_WS = re.compile(r"\s+")
+
+# default "dict" flags minus images: image blocks are dropped inside MuPDF
+# instead of being built as Python dicts and skipped
+_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# markdown heading prefix per level, index 1..6
+_MD_PREFIXES = ["#" * i for i in range(7)]
+
+# headings remembered for de-duplication (same title, level and page)
+DEDUP_WINDOW = 50
 
 
 def normalize(text: str) -> str:
     text = (text or "").strip()
-    text = re.sub(r"\s+", " ", text)
+    text = RE_WS.sub(" ", text)
     return text
 
 
+@lru_cache(maxsize=256)
 def is_probably_bold(fontname: str) -> bool:
-    return "bold" in (fontname or "").lower() or "demi" in (fontname or "").lower()
+    # a document uses a handful of font names, each is lowercased and scanned once
+    f = (fontname or "").lower()
+    return "bold" in f or "demi" in f
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Heading:
     title: str
     level: int
@@ -40,193 +68,269 @@ class Heading:
     score: float
 
 
-def estimate_body_font_size(doc: fitz.Document) -> float:
-    """
-    Estimate the dominant body font size by sampling spans with reasonably long text.
-    """
-    sizes: List[float] = []
-    for page in doc:
-        d = page.get_text("dict")
-        for block in d.get("blocks", []):
-            if block.get("type") != 0:
-                continue
-            for line in block.get("lines", []):
-                for span in line.get("spans", []):
-                    t = (span.get("text") or "").strip()
-                    if len(t) < 25:
-                        continue
-                    sz = span.get("size")
-                    if sz:
-                        sizes.append(round(float(sz), 1))
-
-    if not sizes:
-        return 10.0
+@dataclass(slots=True)
+class _Node:
+    # outline tree node; orjson serializes slotted dataclasses natively,
+    # with the fields in this order
+    title: str
+    level: int
+    page: Optional[int]
+    score: Optional[float]
+    children: List[_Node] = field(default_factory=list)
+
+
+class _Feat(NamedTuple):
+    # per-line heading features
+    text: str
+    avg_size: float
+    bold: bool
+    all_caps: bool
+    ends_with_period: bool
+    looks_short: bool
+    numbered: bool
+    num_kind: Optional[str]
+    num_token: Optional[str]
+
+
+def _iter_line_spans(page_dict: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+    # spans of every text line on a page, flat instead of blocks -> lines -> spans
+    for block in page_dict["blocks"]:
+        if block["type"] != 0:
+            continue
+        for line in block["lines"]:
+            yield line["spans"]
 
-    c = Counter(sizes)
-    return float(c.most_common(1)[0][0])
+
+def _count_body_sizes(bins: array, spans: Iterable[Dict[str, Any]]) -> None:
+    # font sizes of spans with reasonably long text, as integer 0.1pt bins
+    for span in spans:
+        t = (span.get("text") or "").strip()
+        if len(t) < 25:
+            continue
+        sz = span.get("size")
+        if sz:
+            bins.append(round(round(float(sz), 1) * 10))
 
 
-def line_features_from_spans(spans: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
-    text = normalize("".join(s.get("text", "") for s in spans))
+def _dominant_size(bins: array) -> float:
+    if not bins:
+        return 10.0
+    arr = np.frombuffer(bins, dtype=np.int32)
+    counts = np.bincount(arr)
+    ties = np.flatnonzero(counts == counts.max())
+    # on a tie the size seen first wins
+    mode = ties[0] if ties.size == 1 else arr[np.isin(arr, ties).argmax()]
+    return int(mode) / 10.0
+
+
+def line_features_from_spans(spans: List[Dict[str, Any]]) -> Optional[_Feat]:
+    # one pass over the spans for text, size sum and boldness
+    parts: List[str] = []
+    size_sum = 0.0
+    n_sizes = 0
+    bold = False
+    for s in spans:
+        if t := s.get("text", ""):
+            parts.append(t)
+        if sz := s.get("size"):
+            size_sum += float(sz)
+            n_sizes += 1
+        if not bold and is_probably_bold(s.get("font", "")):
+            bold = True
+
+    text = normalize("".join(parts))
     if not text:
         return None
 
-    sizes = [float(s["size"]) for s in spans if s.get("size")]
-    fonts = [s.get("font", "") for s in spans]
-    avg_size = sum(sizes) / len(sizes) if sizes else 0.0
-    bold = any(is_probably_bold(f) for f in fonts)
+    avg_size = size_sum / n_sizes if n_sizes else 0.0
 
-    is_all_caps = text.isupper() and any(c.isalpha() for c in text)
+    # isupper() already requires at least one cased (i.e. alphabetic) character,
+    # so digit/punctuation-only lines are not all caps
+    is_all_caps = text.isupper()
     ends_with_period = text.endswith(".")
     word_count = len(text.split())
     looks_short = word_count <= 14
 
-    numbered = bool(RE_NUMBERED.match(text) or RE_STEP.match(text) or RE_MODULE.match(text) or RE_CHAPTER.match(text))
-
-    return {
-        "text": text,
-        "avg_size": avg_size,
-        "bold": bold,
-        "all_caps": is_all_caps,
-        "ends_with_period": ends_with_period,
-        "looks_short": looks_short,
-        "numbered": numbered,
-    }
+    # one regex call classifies the numbering, assign_level dispatches on the kind;
+    # lines whose first character cannot start a match skip the regex entirely
+    first = text[0]
+    num_kind = None
+    if first.isdecimal() or first in _PREFIX_FIRST_CHARS:
+        m = RE_HEADING_PREFIX.match(text)
+        if m:
+            num_kind = m.lastgroup
+
+    return _Feat(
+        text=text,
+        avg_size=avg_size,
+        bold=bold,
+        all_caps=is_all_caps,
+        ends_with_period=ends_with_period,
+        looks_short=looks_short,
+        numbered=num_kind is not None,
+        num_kind=num_kind,
+        num_token=text.split(" ", 1)[0] if num_kind == "numbered" else None,
+    )
 
 
-def heading_score(feat: Dict[str, Any], body_size: float) -> float:
+def heading_scores(feats: List[_Feat], body_size: float) -> np.ndarray:
     """
     Heuristic score: larger-than-body + bold + numbering + title-ish shortness.
+    Scores all lines at once; the terms are added in a fixed order, so each
+    score is bit-for-bit the per-line sum.
     """
-    score = 0.0
-    score += max(0.0, feat["avg_size"] - body_size) * 1.35
-    if feat["bold"]:
-        score += 1.5
-    if feat["numbered"]:
-        score += 1.2
-    if feat["looks_short"]:
-        score += 0.6
-    if feat["all_caps"]:
-        score += 0.6
-    if feat["ends_with_period"]:
-        score -= 1.0
-    return score
-
-
-def assign_level(feat: Dict[str, Any], body_size: float) -> int:
+    n = len(feats)
+
+    def col(key: str, dtype) -> np.ndarray:
+        return np.fromiter(map(attrgetter(key), feats), dtype=dtype, count=n)
+
+    scores = np.maximum(0.0, col("avg_size", np.float64) - body_size) * 1.35
+    scores += col("bold", bool) * 1.5
+    scores += col("numbered", bool) * 1.2
+    scores += col("looks_short", bool) * 0.6
+    scores += col("all_caps", bool) * 0.6
+    scores -= col("ends_with_period", bool) * 1.0
+    return scores
+
+
+def assign_level(feat: _Feat, body_size: float) -> int:
     """
     Decide H level. Patterns first, then size deltas.
     """
-    txt = feat["text"]
+    kind = feat.num_kind
 
     # explicit patterns first
-    if RE_MODULE.match(txt):
+    if kind == "module" or kind == "chapter":
         return 1
-    if RE_CHAPTER.match(txt):
-        return 1
-    if RE_STEP.match(txt):
+    if kind == "step":
         return 2
-    if RE_NUMBERED.match(txt):
+    if kind == "numbered":
         # deeper levels by dot count: "1"->2, "1.2"->3, "1.2.3"->4...
-        token = txt.split()[0]
-        dots = token.count(".")
+        dots = feat.num_token.count(".")
         return min(4, 2 + dots)
 
-    delta = feat["avg_size"] - body_size
+    delta = feat.avg_size - body_size
     if delta >= 4:
         return 1
     if delta >= 2:
         return 2
-    if delta >= 1 and (feat["bold"] or feat["numbered"]):
+    if delta >= 1 and (feat.bold or feat.numbered):
         return 3
     return 0
 
 
 def extract_headings(pdf_path: Path, min_score: float) -> List[Heading]:
     doc = fitz.open(str(pdf_path))
-    body = estimate_body_font_size(doc)
 
-    headings: List[Heading] = []
+    # single pass over the pages: count body font sizes and keep the line
+    # features, scoring waits until the body size of the whole document is known.
+    # Pages are read on this thread only: PyMuPDF is not thread-safe and keeps the
+    # GIL in get_text(), parallelism comes from one process per PDF (gen_outline)
+    bins = array("i")
+    feats: List[_Feat] = []
+    pages: List[int] = []
     for page_idx, page in enumerate(doc, start=1):
-        d = page.get_text("dict")
-        for block in d.get("blocks", []):
-            if block.get("type") != 0:
-                continue
-            for line in block.get("lines", []):
-                spans = line.get("spans", [])
-                feat = line_features_from_spans(spans)
-                if not feat:
-                    continue
-                score = heading_score(feat, body)
-                if score < min_score:
-                    continue
-                level = assign_level(feat, body)
-                if level == 0:
-                    continue
-
-                headings.append(Heading(
-                    title=feat["text"],
-                    level=level,
-                    page=page_idx,
-                    score=round(score, 2),
-                ))
-
-    # Deduplicate immediate repeats (very common with headers/footers)
-    deduped: List[Heading] = []
-    prev_key = None
-    for h in headings:
-        key = (h.title.lower(), h.level, h.page)
-        if key == prev_key:
+        d = page.get_text("dict", flags=_TEXT_FLAGS)
+        for spans in _iter_line_spans(d):
+            _count_body_sizes(bins, spans)
+            feat = line_features_from_spans(spans)
+            if feat:
+                feats.append(feat)
+                pages.append(page_idx)
+    body = _dominant_size(bins)
+
+    # score every line in one vectorized pass, then only level the ones above min_score
+    scores = heading_scores(feats, body).tolist()
+
+    # Deduplicate repeats (very common with headers/footers) against the last
+    # DEDUP_WINDOW headings, before a Heading is built
+    recent: deque = deque()
+    seen: set = set()
+
+    headings: List[Heading] = []
+    for i, score in enumerate(scores):
+        if score < min_score:
+            continue
+        feat = feats[i]
+        level = assign_level(feat, body)
+        if level == 0:
+            continue
+
+        key = (feat.text.lower(), level, pages[i])
+        if key in seen:
             continue
-        deduped.append(h)
-        prev_key = key
+        if len(recent) == DEDUP_WINDOW:
+            seen.discard(recent.popleft())
+        recent.append(key)
+        seen.add(key)
 
-    return deduped
+        headings.append(Heading(
+            title=feat.text,
+            level=level,
+            page=pages[i],
+            score=round(score, 2),
+        ))
 
+    return headings
 
-def build_tree(headings: List[Heading]) -> Dict[str, Any]:
-    root: Dict[str, Any] = {"title": "ROOT", "level": 0, "page": None, "score": None, "children": []}
-    stack: List[Dict[str, Any]] = [root]
+
+def build_tree(headings: List[Heading]) -> _Node:
+    root = _Node("ROOT", 0, None, None)
+    stack: List[_Node] = [root]
 
     for h in headings:
-        node = {"title": h.title, "level": h.level, "page": h.page, "score": h.score, "children": []}
-        while stack and stack[-1]["level"] >= node["level"]:
+        node = _Node(h.title, h.level, h.page, h.score)
+        while stack and stack[-1].level >= node.level:
             stack.pop()
-        stack[-1]["children"].append(node)
+        stack[-1].children.append(node)
         stack.append(node)
 
     return root
 
 
-def tree_to_markdown(node: Dict[str, Any]) -> str:
+def tree_to_markdown(node: _Node) -> str:
     lines: List[str] = []
 
-    def walk(n: Dict[str, Any]):
-        for ch in n.get("children", []):
-            lvl = int(ch["level"])
-            prefix = "#" * max(1, min(6, lvl))
-            page = ch.get("page")
-            title = ch.get("title", "")
-            lines.append(f"{prefix} {title} (p. {page})")
-            walk(ch)
+    # iterative depth-first walk, children pushed reversed to keep document order
+    stack = list(reversed(node.children))
+    while stack:
+        ch = stack.pop()
+        prefix = _MD_PREFIXES[max(1, min(6, ch.level))]
+        lines.append(f"{prefix} {ch.title} (p. {ch.page})")
+        stack.extend(reversed(ch.children))
 
-    walk(node)
     return "\n".join(lines).strip() + "\n"
 
 
-def slim_tree(node: Dict[str, Any]) -> Dict[str, Any]:
+def slim_tree(node: _Node) -> Dict[str, Any]:
     """
     Remove ROOT and keep a compact JSON suitable for feeding to an LLM.
     """
-    return {"items": node.get("children", [])}
+    return {"items": node.children}
+
+
+def _process_one(pdf: Path, out_dir: Path, min_score: float) -> Tuple[Path, str, int]:
+    # runs in a worker process, which opens its own fitz.Document
+    headings = extract_headings(pdf, min_score=min_score)
+    tree = build_tree(headings)
+    md = tree_to_markdown(tree)
 
+    base = pdf.stem
+    json_path = out_dir / f"{base}.outline.json"
+    md_path = out_dir / f"{base}.outline.md"
+
+    payload = {
+        "pdf": pdf.name,
+        "path": str(pdf),
+        "min_score": min_score,
+        "headings_count": len(headings),
+        "outline": slim_tree(tree),
+    }
 
-def load_all_trees(outline_json_paths: List[Path]) -> Dict[str, Any]:
-    combined: Dict[str, Any] = {"pdfs": []}
-    for p in outline_json_paths:
-        data = json.loads(p.read_text(encoding="utf-8"))
-        combined["pdfs"].append(data)
-    return combined
+    json_path.write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+    md_path.write_bytes(md.encode("utf-8"))
+
+    return json_path, md, len(headings)
 
 
 def  gen_outline(in_dir, out_dir) -> int: # IGNORE:C0111
@@ -248,47 +352,38 @@ def  gen_outline(in_dir, out_dir) -> int: # IGNORE:C0111
     out_dir = Path(out_dir).expanduser().resolve()
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    pdfs = sorted(in_dir.glob("*.pdf"))
+    # one directory read, no per-entry Path objects for non-PDF files
+    with os.scandir(in_dir) as it:
+        pdfs = sorted(Path(e.path) for e in it if e.is_file() and e.name.lower().endswith(".pdf"))
     if not pdfs:
         raise SystemExit(f"No PDFs found in %s matching *.pdf ", in_dir)
 
-    all_outline_jsons: List[Path] = []
-    combined_md_lines: List[str] = []
-
-    for pdf in pdfs:
-        headings = extract_headings(pdf, min_score=min_score)
-        tree = build_tree(headings)
-        md = tree_to_markdown(tree)
-
-        base = pdf.stem
-        json_path = out_dir / f"{base}.outline.json"
-        md_path = out_dir / f"{base}.outline.md"
-
-        payload = {
-            "pdf": pdf.name,
-            "path": str(pdf),
-            "min_score": min_score,
-            "headings_count": len(headings),
-            "outline": slim_tree(tree),
-        }
-
-        json_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
-        md_path.write_text(md, encoding="utf-8")
-
-        all_outline_jsons.append(json_path)
-
-        combined_md_lines.append(f"# {pdf.name}")
-        combined_md_lines.append(md)
-        combined_md_lines.append("")  # spacer
-
-        print(f"[OK] {pdf.name}: {len(headings)} headings -> {md_path.name}, {json_path.name}")
-
-    # Combined outputs
-    combined_md = "\n".join(combined_md_lines).strip() + "\n"
-    (out_dir / "ALL.outlines.md").write_text(combined_md, encoding="utf-8")
-
-    combined_json = load_all_trees(all_outline_jsons)
-    (out_dir / "ALL.outlines.json").write_text(json.dumps(combined_json, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Combined outputs are streamed: each PDF's markdown and outline JSON go to
+    # ALL.outlines.md / ALL.outlines.json as soon as its result arrives.
+    # The JSON is the indented {"pdfs": [...]} document, each per-PDF file is
+    # spliced in with one more indent level instead of being parsed again.
+    n = len(pdfs)
+    md_pending: Optional[str] = None
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, n)) as ex, \
+            (out_dir / "ALL.outlines.md").open("wb") as all_md, \
+            (out_dir / "ALL.outlines.json").open("wb") as all_json:
+        all_json.write(b'{\n  "pdfs": [\n')
+        # one PDF per worker process, PyMuPDF parsing runs on all cores;
+        # results come back in input order
+        results = ex.map(_process_one, pdfs, [out_dir] * n, [min_score] * n)
+        for i, (pdf, (json_path, md, n_headings)) in enumerate(zip(pdfs, results)):
+            if md_pending is not None:
+                all_md.write((md_pending + "\n\n").encode("utf-8"))
+            md_pending = f"# {pdf.name}\n{md}"
+
+            if i:
+                all_json.write(b",\n")
+            all_json.write(b"    " + json_path.read_bytes().replace(b"\n", b"\n    "))
+
+            print(f"[OK] {pdf.name}: {n_headings} headings -> {pdf.stem}.outline.md, {json_path.name}")
+
+        all_md.write((md_pending.rstrip() + "\n").encode("utf-8"))
+        all_json.write(b"\n  ]\n}")
 
     print(f"\n[OK] Wrote combined: ALL.outlines.md, ALL.outlines.json to {out_dir}")
 
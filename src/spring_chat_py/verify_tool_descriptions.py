@@ -10,25 +10,70 @@ import sys, yaml
 from qdrant_client import QdrantClient
 from qdrant_client.models import SearchRequest
 from qdrant_client.models import Filter, FieldCondition, MatchValue
+from qdrant_client.models import QueryRequest
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 
 log = logging.getLogger(__name__)
 
 # Qdrant
 QDRANT_URL = "http://localhost:6333"
+QDRANT_GRPC_PORT = 6334
 COLLECTION_NAME = "springchat_tools_bg3_m3"
 
 OLLAMA_URL = "http://localhost:11434"
 MODEL = "bge-m3"   # or "bg3_m3" if that is your local alias
 
+_NL_TABLE = str.maketrans({"\n": " "})
+
+# one pooled keep-alive session for all Ollama calls
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=32, max_retries=0))
+
+# gRPC: protobuf vectors instead of JSON floats, one HTTP/2 connection
+client = QdrantClient(url=QDRANT_URL, prefer_grpc=True, grpc_port=QDRANT_GRPC_PORT)
+
+# semantic cache: L2-normalized query vectors and their Qdrant results
+CACHE_SIMILARITY = 0.95
+_CACHE_VECS: np.ndarray | None = None
+_CACHE_RES: list = []
+
+#
+def _unit(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+#
+def _cache_lookup(vec: np.ndarray):
+    if _CACHE_VECS is None:
+        return None
+    sims = _CACHE_VECS @ vec
+    i = int(sims.argmax())
+    if sims[i] >= CACHE_SIMILARITY:
+        log.debug("semantic cache hit: %.3f", sims[i])
+        return _CACHE_RES[i]
+    return None
+
+#
+def _cache_store(vec: np.ndarray, points) -> None:
+    global _CACHE_VECS
+    _CACHE_VECS = vec[np.newaxis, :] if _CACHE_VECS is None else np.vstack([_CACHE_VECS, vec])
+    _CACHE_RES.append(points)
+
+#
+def log_points(points):
+    # skip payload lookups and string copies when INFO is not emitted
+    if not log.isEnabledFor(logging.INFO):
+        return
+    for p in points:
+        payload = p.payload
+        log.info("Score: %.3f  Tool: %-20.20s  Description: %s", p.score, payload.get("toolName"), (payload.get("toolDescription") or "").translate(_NL_TABLE))
+
 #
 def qdrant_search(query_embedding):
-    # Connect to Qdrant
-    client = QdrantClient(
-        url=QDRANT_URL   # or host="localhost", port=6333
-    )
-    
     # Search
     results = client.query_points(
         collection_name=COLLECTION_NAME,
@@ -37,10 +82,7 @@ def qdrant_search(query_embedding):
         with_payload=True,   # return stored metadata
         with_vectors=False
     )
-    
-    # Print results
-    for p in results.points:
-        log.info("Score: %.3f  Tool: %-20.20s  Description: %s", p.score, p.payload.get("toolName"), p.payload.get("toolDescription").replace("\n", ""))
+    return results.points
 
 #
 def qdrant_filter_search(client: QdrantClient, query_embedding: list[float]):
@@ -60,17 +102,41 @@ def qdrant_filter_search(client: QdrantClient, query_embedding: list[float]):
 )
 
 #
-def get_query_embedding(query_text: str) -> list[float]:
-    response = requests.post(
-        f"{OLLAMA_URL}/api/embeddings",
+def get_query_embedding(query_text: str, use_legacy: bool = False) -> list[float]:
+    if use_legacy:
+        # deprecated single-text endpoint, kept for older Ollama servers
+        response = _SESSION.post(
+            f"{OLLAMA_URL}/api/embeddings",
+            json={
+                "model": MODEL,
+                "prompt": query_text
+            },
+            timeout=60
+        )
+        response.raise_for_status()
+        return response.json()["embedding"]
+
+    return get_query_embeddings([query_text])[0]
+
+#
+def get_query_embeddings(query_texts: list[str]) -> list[list[float]]:
+    response = _SESSION.post(
+        f"{OLLAMA_URL}/api/embed",
         json={
             "model": MODEL,
-            "prompt": query_text
+            "input": query_texts
         },
         timeout=60
     )
     response.raise_for_status()
-    return response.json()["embedding"]
+    embs = response.json()["embeddings"]
+    if len(embs) != len(query_texts):
+        if len(query_texts) == 1:
+            raise ValueError(f"Expected 1 embedding, got {len(embs)}")
+        # safety net: fall back to one request per query
+        log.warning("Embedding count mismatch: got %d embeddings for %d queries, retrying per query", len(embs), len(query_texts))
+        embs = [get_query_embeddings([text])[0] for text in query_texts]
+    return embs
 
 def query_search(query_text: str):
     log.info("")
@@ -79,7 +145,12 @@ def query_search(query_text: str):
     
     query_embedding = get_query_embedding(query_text)
     #log.debug("query_text embedding: %s", len(query_embedding))
-    qdrant_search(query_embedding)
+    vec = _unit(query_embedding)
+    points = _cache_lookup(vec)
+    if points is None:
+        points = qdrant_search(query_embedding)
+        _cache_store(vec, points)
+    log_points(points)
     log.info("")
     log.debug("")
 
@@ -88,15 +159,44 @@ def main(argv: list[str] | None = None) -> int: # IGNORE:C0111
     log.info("XXXXXXXXXXXXXXXX")
     log.info(" spring-chat-py")
     
-    query_search("What time is now?")
-    query_search("What day is today?")    
-    query_search("What have been my latest activities?")        
-    query_search("Can you load whoop activities from last week?")  
-    query_search("Can you make a list of all certificates?")
-    
-    query_search("Welche Zeit haben wir?")
-    query_search("Welche Tag ist heute?")    
-    query_search("Was waren die letzen Aktivitäten?")        
-    query_search("Kannst du die Aktivitäten von letzer Woche von Whoop laden?")  
-    query_search("Kannst du die Zertifikate auflisten?")
+    queries = [
+        "What time is now?",
+        "What day is today?",
+        "What have been my latest activities?",
+        "Can you load whoop activities from last week?",
+        "Can you make a list of all certificates?",
+
+        "Welche Zeit haben wir?",
+        "Welche Tag ist heute?",
+        "Was waren die letzen Aktivitäten?",
+        "Kannst du die Aktivitäten von letzer Woche von Whoop laden?",
+        "Kannst du die Zertifikate auflisten?",
+    ]
+
+    # one embed request for all queries; cache hits are answered locally and
+    # only the misses go to Qdrant in one batch search
+    query_embeddings = get_query_embeddings(queries)
+    vecs = [_unit(v) for v in query_embeddings]
+    results = [_cache_lookup(vec) for vec in vecs]
+    misses = [i for i, points in enumerate(results) if points is None]
+
+    if misses:
+        responses = client.query_batch_points(
+            collection_name=COLLECTION_NAME,
+            requests=[
+                QueryRequest(query=query_embeddings[i], limit=5, with_payload=True, with_vector=False)
+                for i in misses
+            ],
+        )
+        for i, response in zip(misses, responses):
+            results[i] = response.points
+            _cache_store(vecs[i], response.points)
+
+    for query_text, points in zip(queries, results):
+        log.info("")
+        log.info("query_text: %s", query_text)
+        log.info("")
+        log_points(points)
+        log.info("")
+
     
\ No newline at end of file